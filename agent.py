@@ -9,11 +9,38 @@ This file provides:
 Note: Replace mock tools with real API calls as needed. Do NOT include API keys.
 """
 
+import atexit
+import bisect
 import json
 import logging
+import os
 import random
+import sqlite3
+import sys
+import time
 import datetime
-from typing import List, Dict, Any
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import List, Dict, Any, Iterable, Tuple
+
+try:  # optional fast JSON codec
+    import orjson
+    _loads = orjson.loads
+
+    def _dumps(obj) -> bytes:
+        # accept non-str keys (stringified) like the stdlib fallback does
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+# dinners per weekly plan
+WEEK_LEN = 7
+# planner solver bound: candidates kept per ranking (overlap, cost)
+SOLVER_TOP_K = 40
 
 # -------- logging / observability --------
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -21,32 +48,127 @@ logger = logging.getLogger("ConciergeChef")
 
 # -------- simple memory bank & session --------
 class MemoryBank:
-    def __init__(self, filename="data/memory.json"):
+    """User store backed by SQLite: one JSON blob per user, written in batched transactions.
+
+    `filename` is the legacy JSON store; its users are imported the first time the
+    database is opened empty. The database lives at `db_path`, by default next to
+    `filename` with a .db suffix (so MemoryBank("data/memory.json") keeps working).
+    """
+    def __init__(self, filename="data/memory.json", db_path=None):
         self.filename = filename
+        self.db_path = db_path or os.path.splitext(filename)[0] + ".db"
+        self.conn = self._connect(self.db_path)
+        # decoded users read so far, and the ids with unflushed changes
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._pending = set()
+        # bumped whenever a pantry or preferences change lands, so callers can drop derived caches
+        self.revision = 0
+        if os.path.abspath(filename) != os.path.abspath(self.db_path):
+            self._import_legacy(filename)
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _connect(path: str):
         try:
-            with open(self.filename, "r") as f:
-                self.store = json.load(f)
+            parent = os.path.dirname(path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS users(uid TEXT PRIMARY KEY, blob BLOB)")
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            # like a missing JSON store before, fall back to an empty (unsaved) store
+            logger.warning("[Memory] cannot open %s (%s); using an in-memory store", path, e)
+            conn = sqlite3.connect(":memory:")
+            conn.execute("CREATE TABLE users(uid TEXT PRIMARY KEY, blob BLOB)")
+            return conn
+
+    def _import_legacy(self, path: str):
+        # one-time migration from the old single-file JSON store into an empty database
+        if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        try:
+            with open(path, "rb") as f:
+                users = _loads(f.read()).get("users", {})
         except Exception:
-            self.store = {"users": {}}
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO users VALUES(?,?)", [(uid, _dumps(u)) for uid, u in users.items()])
+
+    def _load(self, user_id: str):
+        user = self._users.get(user_id)
+        if user is None:
+            row = self.conn.execute("SELECT blob FROM users WHERE uid=?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            user = self._users[user_id] = _loads(row[0])
+        return user
 
     def get_user(self, user_id: str):
-        return self.store["users"].get(user_id, {"preferences": {}, "pantry": [], "history": []})
+        user = self._load(user_id)
+        return user if user is not None else {"preferences": {}, "pantry": [], "history": []}
 
     def update_user(self, user_id: str, data: Dict[str, Any]):
-        self.store["users"].setdefault(user_id, {}).update(data)
-        self._persist()
+        self._apply(user_id, data)
+
+    def update_users_batch(self, updates: List[Tuple[str, Dict[str, Any]]]):
+        """Apply several user updates and persist them in a single transaction."""
+        for user_id, data in updates:
+            self._apply(user_id, data)
+        self.flush()
+
+    def _apply(self, user_id: str, data: Dict[str, Any]):
+        user = self._load(user_id)
+        if user is None:
+            user = self._users[user_id] = {}
+        user.update(data)
+        self._pending.add(user_id)
+        if "pantry" in data or "preferences" in data:
+            self.revision += 1
 
-    def _persist(self):
-        with open(self.filename, "w") as f:
-            json.dump(self.store, f, indent=2)
+    def flush(self):
+        """Write pending user updates to the database in one transaction."""
+        if not self._pending:
+            return
+        rows = [(uid, _dumps(self._users[uid])) for uid in self._pending]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO users VALUES(?,?)", rows)
+        self._pending.clear()
+
+    def close(self):
+        """Flush pending updates, close the database and drop the exit hook."""
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+        atexit.unregister(self.flush)
 
 # -------- mock tools --------
+@dataclass(slots=True)
+class Candidate:
+    """Search hit: a reference to the (shared, unmodified) recipe plus per-query facts."""
+    rid: str
+    recipe: Dict[str, Any]
+    pantry_overlap: int
+    score: float
+    estimated_cost: float = 0.0
+
+def _score_kernel(masks: List[int], pantry_mask: int, jitter=None) -> Tuple[List[int], List[float]]:
+    """Pantry-overlap popcount (+ optional jitter) for each recipe bitmask."""
+    overlaps = [(m & pantry_mask).bit_count() for m in masks]
+    if jitter is None:
+        return overlaps, [float(o) for o in overlaps]
+    return overlaps, [o + j for o, j in zip(overlaps, jitter)]
+
 class RecipeTool:
     """Mock recipe search tool. Replace with real API integration."""
     def __init__(self, recipes_file="data/sample_recipes.json"):
         try:
-            with open(recipes_file) as f:
-                self.recipes = json.load(f)
+            with open(recipes_file, "rb") as f:
+                self.recipes = _loads(f.read())
         except Exception:
             # minimal sample fallback
             self.recipes = [
@@ -54,127 +176,302 @@ class RecipeTool:
                 {"id": "r2", "title": "Tomato Pasta", "ingredients": ["pasta", "tomato", "olive oil"], "diet": "vegetarian", "time": 30},
                 {"id": "r3", "title": "Veg Stir Fry", "ingredients": ["mixed veg", "soy sauce", "rice"], "diet": "vegetarian", "time": 20}
             ]
+        self._build_index()
+
+    def _build_index(self):
+        # index recipes by diet, each bucket sorted by prep time so search can
+        # bisect on max_time instead of scanning every recipe; ingredients are
+        # packed as int bitmasks over a shared vocabulary
+        self._ing_vocab = {}
+        for r in self.recipes:
+            for ing in r.get("ingredients", []):
+                self._ing_vocab.setdefault(ing, len(self._ing_vocab))
+        entries = sorted(
+            ((r.get("time", 999), r, self._mask(r.get("ingredients", []))) for r in self.recipes),
+            key=lambda e: e[0],
+        )
+        by_diet = defaultdict(list)
+        for e in entries:
+            by_diet[e[1].get("diet")].append(e)
+        self._all_sorted = self._bucket(entries)
+        self.by_diet = {diet: self._bucket(lst) for diet, lst in by_diet.items()}
 
-    def search(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
-        # query contains: diet, pantry, max_time
+    @staticmethod
+    def _bucket(entries):
+        # (times, recipes, ingredient bitmasks) as parallel lists
+        return [e[0] for e in entries], [e[1] for e in entries], [e[2] for e in entries]
+
+    def _mask(self, ingredients) -> int:
+        # ingredients outside the vocabulary can never overlap a recipe, so they are dropped;
+        # OR-ing bits makes duplicates harmless without building a set first
+        vocab = self._ing_vocab
+        mask = 0
+        for ing in ingredients:
+            bit = vocab.get(ing)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def search(self, query: Dict[str, Any]) -> List[Candidate]:
+        # query contains: diet, pantry, max_time and an optional seed for
+        # reproducible random tiebreaks (default: deterministic ordering)
         diet = query.get("diet")
-        pantry = set(query.get("pantry", []))
+        pantry_mask = self._mask(query.get("pantry", []))
         max_time = query.get("max_time", 60)
-        results = []
-        for r in self.recipes:
-            if diet and r.get("diet") != diet:
-                continue
-            if r.get("time", 999) > max_time:
-                continue
-            # simple pantry match score
-            pantry_overlap = len(pantry.intersection(r.get("ingredients", [])))
-            score = pantry_overlap + random.random()  # small randomness
-            r_copy = r.copy()
-            r_copy["pantry_overlap"] = pantry_overlap
-            r_copy["score"] = score
-            results.append(r_copy)
-        results.sort(key=lambda x: (-x["score"], x["time"]))
-        return results
+        times, recipes, masks = self.by_diet.get(diet, ([], [], [])) if diet else self._all_sorted
+        cutoff = bisect.bisect_right(times, max_time)
+        # simple pantry match score: popcount of shared ingredient bits
+        seed = query.get("seed")
+        jitter = None
+        if seed is not None:
+            rng = random.Random(seed)
+            jitter = [rng.random() for _ in range(cutoff)]
+        overlaps, scores = _score_kernel(masks[:cutoff], pantry_mask, jitter)
+        order = sorted(range(cutoff), key=lambda i: (-scores[i], times[i], recipes[i]["id"]))
+        return [Candidate(recipes[i]["id"], recipes[i], overlaps[i], scores[i]) for i in order]
 
 class PriceTool:
     """Mock price lookup (returns estimated price per ingredient)."""
+    # naive price map
+    _BASE = {"rice": 2.5, "canned beans": 1.2, "tomato": 0.7, "pasta": 1.0, "olive oil": 3.0, "mixed veg": 2.0, "soy sauce": 1.0}
+    DEFAULT_PRICE = 1.5  # for ingredients missing from the map
+
+    def __init__(self):
+        # plain dict memo rather than lru_cache on bound methods, which keeps
+        # the lookup cheap and inlinable under PyPy's JIT
+        self._totals: Dict[Tuple[str, ...], float] = {}
+
+    def price(self, ing: str) -> float:
+        """Price of one ingredient; the single pricing rule every caller goes through."""
+        return self._BASE.get(ing, self.DEFAULT_PRICE)
+
+    def total_for(self, ings: Tuple[str, ...]) -> float:
+        """Cached total cost for a recipe's ingredient tuple."""
+        total = self._totals.get(ings)
+        if total is None:
+            total = self._totals[ings] = sum(map(self.price, ings))
+        return total
+
     def estimate(self, ingredients: List[str]) -> Dict[str, float]:
-        # naive price map
-        base = {"rice": 2.5, "canned beans": 1.2, "tomato": 0.7, "pasta": 1.0, "olive oil": 3.0, "mixed veg": 2.0, "soy sauce": 1.0}
-        return {ing: base.get(ing, 1.5) for ing in ingredients}
+        """Estimated price per ingredient."""
+        return {ing: self.price(ing) for ing in ingredients}
 
 class CalendarTool:
     """Mock calendar event creator - prints and returns an event id."""
     def create_event(self, user_id: str, title: str, dt: datetime.datetime, notes: str = "") -> Dict[str, Any]:
         event_id = f"ev_{random.randint(1000, 9999)}"
-        logger.info(f"[Calendar] create_event user={user_id} event_id={event_id} title={title} dt={dt.isoformat()}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Calendar] create_event user=%s event_id=%s title=%s dt=%s", user_id, event_id, title, dt.isoformat())
         return {"event_id": event_id, "title": title, "datetime": dt.isoformat(), "notes": notes}
 
+    def create_events_bulk(self, user_id: str, specs: List[Tuple[str, datetime.datetime, str]]) -> List[Dict[str, Any]]:
+        """Create several events in one call. specs are (title, dt, notes) tuples.
+        A real Calendar API would send these as a single batch request."""
+        events = [
+            {"event_id": f"ev_{random.randint(1000, 9999)}", "title": title, "datetime": dt.isoformat(), "notes": notes}
+            for title, dt, notes in specs
+        ]
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Calendar] create_events_bulk user=%s count=%d event_ids=%s", user_id, len(events), [ev["event_id"] for ev in events])
+        return events
+
 # -------- agents --------
 class PlannerAgent:
     def __init__(self, recipe_tool: RecipeTool, price_tool: PriceTool):
         self.recipe_tool = recipe_tool
         self.price_tool = price_tool
 
-    def generate_weekly_plan(self, user_profile: Dict[str, Any], pantry: List[str], constraints: Dict[str, Any]):
-        """Return a list of 7 meals (dinner) with metadata and estimated cost."""
+    def generate_weekly_plan(self, user_profile: Dict[str, Any], pantry: Iterable[str], constraints: Dict[str, Any]):
+        """Return (plan, estimated_total): WEEK_LEN meals (dinner) with metadata and estimated cost."""
         diet = user_profile.get("diet", "vegetarian")
         max_time = constraints.get("max_time", 60)
         budget = constraints.get("budget", 60)
-        logger.info(f"[Planner] Generating plan diet={diet} budget={budget} max_time={max_time}")
+        logger.info("[Planner] Generating plan diet=%s budget=%s max_time=%s", diet, budget, max_time)
 
-        # For simplicity: pick top N unique recipes from search
         all_candidates = self.recipe_tool.search({"diet": diet, "pantry": pantry, "max_time": max_time})
+        plan = self._solve_plan(all_candidates, budget)
+        if plan is not None:
+            total_estimated = sum(p.estimated_cost for p in plan)
+            logger.info("[Planner] Solved plan within budget, cost=%.2f", total_estimated)
+        else:
+            logger.info("[Planner] No plan fits the budget, falling back to heuristic")
+            plan, total_estimated = self._heuristic_plan(all_candidates, budget, pantry)
+        return plan, total_estimated
+
+    def _solve_plan(self, candidates: List[Candidate], budget: float, days: int = WEEK_LEN,
+                    min_reuse: float = 0.4, top_k: int = SOLVER_TOP_K):
+        """Meal selection as a small integer program, solved by dynamic programming (exact up to top_k pruning).
+
+        Picks `days` meals maximizing total pantry overlap subject to cost <= budget
+        and pantry overlap >= min_reuse of all ingredients used. The reuse constraint
+        is relaxed if it cannot be met; returns None if nothing fits the budget.
+        With more than top_k candidates, only the top_k by overlap and the top_k
+        cheapest are considered, so the result is then a heuristic.
+        Recipes repeat only when there are fewer than `days` candidates, and then
+        as evenly as possible (at most ceil(days / candidates) times each).
+        """
+        unique = list({c.rid: c for c in candidates}.values())
+        if not unique:
+            return None
+        total_for = self.price_tool.total_for
+        cost_of = {c.rid: total_for(tuple(c.recipe["ingredients"])) for c in unique}
+        if len(unique) > top_k:
+            by_overlap = sorted(unique, key=lambda c: (-c.pantry_overlap, cost_of[c.rid]))[:top_k]
+            by_cost = sorted(unique, key=lambda c: cost_of[c.rid])[:top_k]
+            unique = list({c.rid: c for c in by_overlap + by_cost}.values())
+        # repeating the few matching recipes beats filling the week with ones that break diet/time
+        cap = 1 if len(unique) >= days else -(-days // len(unique))
+
+        # layers[meals][overlap] -> Pareto front of nodes (cost, ingredients, parent, idx, q);
+        # nodes are back-pointers, so a plan is only rebuilt once at the end
+        layers = [defaultdict(list) for _ in range(days + 1)]
+        layers[0][0].append((0.0, 0, None, -1, 0))
+        for idx, c in enumerate(unique):
+            overlap, n_ings, cost = c.pantry_overlap, len(c.recipe["ingredients"]), cost_of[c.rid]
+            # walk meal counts downwards so states created for this recipe aren't extended by it again
+            for k in range(days - 1, -1, -1):
+                for o, front in layers[k].items():
+                    for node in front:
+                        for q in range(1, min(cap, days - k) + 1):
+                            t = node[0] + cost * q
+                            if t > budget:
+                                break
+                            _pareto_insert(layers[k + q][o + overlap * q], (t, node[1] + n_ings * q, node, idx, q))
+
+        best = None
+        for relaxed in (False, True):
+            for o, front in layers[days].items():
+                for node in front:
+                    if not relaxed and o < min_reuse * node[1]:
+                        continue
+                    if best is None or (o, -node[0]) > (best[0], -best[1][0]):
+                        best = (o, node)
+            if best is not None:
+                break
+        if best is None:
+            return None
+        picks = []
+        node = best[1]
+        while node[2] is not None:
+            picks.append((node[3], node[4]))
+            node = node[2]
         plan = []
-        i = 0
-        # loop agent behavior: try to ensure pantry reuse >= 40% by re-scoring / re-running
-        while len(plan) < 7 and i < max(7, len(all_candidates)*2):
-            if i < len(all_candidates):
-                candidate = all_candidates[i].copy()
-                candidate["estimated_cost"] = sum(self.price_tool.estimate(candidate["ingredients"]).values())
-                plan.append(candidate)
-            else:
-                # fallback: random pick
-                plan.append(random.choice(self.recipe_tool.recipes))
-            i += 1
-        plan = plan[:7]
+        for idx, q in reversed(picks):
+            c = unique[idx]
+            c.estimated_cost = cost_of[c.rid]
+            # a recipe picked more than once shares a single Candidate
+            plan.extend([c] * q)
+        return plan
+
+    def _heuristic_plan(self, all_candidates: List[Candidate], budget: float, pantry: Iterable[str]):
+        """Greedy top-N pick with swap-based re-optimization; used when the solver finds no plan."""
+        plan = _pick_7(all_candidates, self.recipe_tool, self.price_tool.total_for, pantry)
 
         # compact cost check and simple re-run if budget exceeded
-        total_estimated = sum([p.get("estimated_cost", 3.0) for p in plan])
-        logger.info(f"[Planner] Estimated weekly dinner cost: {total_estimated:.2f}")
+        total_estimated = sum([p.estimated_cost for p in plan])
+        logger.info("[Planner] Estimated weekly dinner cost: %.2f", total_estimated)
         # Minimal loop optimization: if over budget, replace highest-cost meal with lower-cost candidate
         attempts = 0
         while total_estimated > budget and attempts < 5:
-            plan.sort(key=lambda x: x.get("estimated_cost", 0), reverse=True)
+            plan.sort(key=lambda x: x.estimated_cost, reverse=True)
+            plan_ids = {p.rid for p in plan}
             # try to find a cheaper candidate
-            for c in all_candidates[::-1]:
-                if c["id"] not in [p["id"] for p in plan]:
-                    c_copy = c.copy()
-                    c_copy["estimated_cost"] = sum(self.price_tool.estimate(c_copy["ingredients"]).values())
-                    plan[0] = c_copy
+            for c in reversed(all_candidates):
+                if c.rid not in plan_ids:
+                    c.estimated_cost = self.price_tool.total_for(tuple(c.recipe["ingredients"]))
+                    plan[0] = c
                     break
-            total_estimated = sum([p.get("estimated_cost", 3.0) for p in plan])
+            total_estimated = sum([p.estimated_cost for p in plan])
             attempts += 1
-            logger.info(f"[Planner] Re-optimizing attempt {attempts}, cost={total_estimated:.2f}")
+            logger.info("[Planner] Re-optimizing attempt %d, cost=%.2f", attempts, total_estimated)
+        return plan, total_estimated
+
+def _pareto_insert(front: List[Tuple], node: Tuple):
+    # within one (meals, overlap) state, a node that costs more and uses more
+    # ingredients can never lead to a better plan, so only the front is kept
+    cost, n_ings = node[0], node[1]
+    for other in front:
+        if other[0] <= cost and other[1] <= n_ings:
+            return
+    front[:] = [other for other in front if not (cost <= other[0] and n_ings <= other[1])]
+    front.append(node)
 
-        # scoring & metadata
-        for p in plan:
-            p["pantry_overlap"] = len(set(p.get("ingredients", [])).intersection(set(pantry)))
-        return {"plan": plan, "estimated_total": total_estimated}
+def _pick_7(all_candidates: List[Candidate], recipe_tool: RecipeTool, price_fn, pantry: Iterable[str]) -> List[Candidate]:
+    """Top WEEK_LEN candidates, topped up with random recipes if search returned too few."""
+    plan = [None] * WEEK_LEN
+    k = 0
+    for c in all_candidates:
+        if k == WEEK_LEN:
+            break
+        plan[k] = c
+        k += 1
+    if k < WEEK_LEN and k:
+        # too few matches: repeat random matching candidates, drawn in one call
+        for j, c in enumerate(random.choices(all_candidates, k=WEEK_LEN - k), k):
+            plan[j] = c
+    elif k < WEEK_LEN:
+        # nothing matched at all: random picks from every recipe, scored like search hits
+        pantry_mask = recipe_tool._mask(pantry)
+        for j, recipe in enumerate(random.choices(recipe_tool.recipes, k=WEEK_LEN - k), k):
+            overlap = (recipe_tool._mask(recipe.get("ingredients", ())) & pantry_mask).bit_count()
+            plan[j] = Candidate(recipe["id"], recipe, overlap, float(overlap))
+    for c in plan:
+        c.estimated_cost = price_fn(tuple(c.recipe["ingredients"]))
+    return plan
 
 class ShoppingListAgent:
     def __init__(self, price_tool: PriceTool):
         self.price_tool = price_tool
 
-    def build_shopping_list(self, plan: List[Dict[str, Any]], pantry: List[str]):
-        # aggregate ingredients and subtract pantry
-        agg = {}
+    def build_shopping_list(self, plan: List[Candidate], pantry: Iterable[str]):
+        # single pass: aggregate ingredients, subtract pantry and price new items
+        pantry = frozenset(pantry)
+        price = self.price_tool.price
+        items, prices, total = {}, {}, 0.0
         for meal in plan:
-            for ing in meal.get("ingredients", []):
-                agg[ing] = agg.get(ing, 0) + 1
-        shopping = {ing: qty for ing, qty in agg.items() if ing not in pantry}
-        # estimate prices
-        prices = self.price_tool.estimate(list(shopping.keys()))
-        total = sum(prices.values())
-        return {"items": shopping, "prices": prices, "estimated_total": total}
+            for ing in meal.recipe.get("ingredients", ()):
+                if ing in pantry:
+                    continue
+                if ing in items:
+                    items[ing] += 1
+                    continue
+                items[ing] = 1
+                p = prices[ing] = price(ing)
+                total += p
+        return {"items": items, "prices": prices, "estimated_total": total}
 
 class SchedulerAgent:
     def __init__(self, calendar_tool: CalendarTool):
         self.calendar_tool = calendar_tool
 
-    def schedule_meals(self, user_id: str, plan: List[Dict[str, Any]], start_date: datetime.date):
-        events = []
-        date = start_date
-        for meal in plan:
-            dt = datetime.datetime.combine(date, datetime.time(19, 0))  # default dinner at 7 PM
-            ev = self.calendar_tool.create_event(user_id, f"Cook: {meal['title']}", dt, notes="Prep time: {} mins".format(meal.get("time", 30)))
-            events.append(ev)
-            date += datetime.timedelta(days=1)
-        return events
+    def schedule_meals(self, user_id: str, plan: List[Candidate], start_date: datetime.date):
+        base = datetime.datetime.combine(start_date, datetime.time(19, 0))  # default dinner at 7 PM
+        dts = [base + datetime.timedelta(days=i) for i in range(len(plan))]
+        specs = [
+            (f"Cook: {meal.recipe['title']}", dt, "Prep time: {} mins".format(meal.recipe.get("time", 30)))
+            for meal, dt in zip(plan, dts)
+        ]
+        return self.calendar_tool.create_events_bulk(user_id, specs)
 
 # -------- Master orchestration --------
+_summary_fields = itemgetter("id", "title", "ingredients")
+
+def _summarize(p: Candidate) -> Dict[str, Any]:
+    rid, title, ingredients = _summary_fields(p.recipe)
+    return {"id": rid, "title": title, "ingredients": ingredients, "estimated_cost": p.estimated_cost}
+
+# shape-specific deep copies of the cached results; several times cheaper than copy.deepcopy
+def _copy_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "plan": [{**meal, "ingredients": list(meal["ingredients"])} for meal in summary["plan"]],
+        "estimated_total": summary["estimated_total"],
+    }
+
+def _copy_shopping(shopping: Dict[str, Any]) -> Dict[str, Any]:
+    return {"items": dict(shopping["items"]), "prices": dict(shopping["prices"]), "estimated_total": shopping["estimated_total"]}
+
 class ConciergeChef:
-    def __init__(self, memory: MemoryBank):
+    def __init__(self, memory: MemoryBank, plan_cache_size: int = 128):
         self.memory = memory
         self.recipe_tool = RecipeTool()
         self.price_tool = PriceTool()
@@ -182,32 +479,77 @@ class ConciergeChef:
         self.planner = PlannerAgent(self.recipe_tool, self.price_tool)
         self.shopper = ShoppingListAgent(self.price_tool)
         self.scheduler = SchedulerAgent(self.calendar_tool)
+        # memoized (plan, summary, shopping) keyed on the planner inputs, least recently used first
+        self._plan_cache: "OrderedDict[Tuple, Tuple[List[Candidate], Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+        self.plan_cache_size = plan_cache_size
+        self._cache_revision = memory.revision
 
     def handle_request(self, user_id: str, request: Dict[str, Any]):
         # Input: request contains constraints and an action 'plan_week'
-        user = self.memory.get_user(user_id)
-        pantry = user.get("pantry", request.get("pantry", []))
+        memory = self.memory
+        user = memory.get_user(user_id)
+        pantry = frozenset(user.get("pantry", request.get("pantry", [])))
         preferences = user.get("preferences", {})
+        request_profile = request.get("profile") or {}
         # Merge provided constraints
         constraints = request.get("constraints", {"budget": 60, "max_time": 60})
-        # Planner Agent
-        result = self.planner.generate_weekly_plan({**preferences, **request.get("profile", {})}, pantry, constraints)
-        plan = result["plan"]
-        summary = {
-            "plan": [{"id": p["id"], "title": p["title"], "ingredients": p["ingredients"], "estimated_cost": p.get("estimated_cost", 0)} for p in plan],
-            "estimated_total": result["estimated_total"]
-        }
-        # Shopping List Agent
-        shopping = self.shopper.build_shopping_list(plan, pantry)
+        auto_schedule = request.get("auto_schedule", False)
+        # first-time users have no stored preferences: use the request profile as-is
+        profile = preferences | request_profile if preferences else request_profile
+        if self._cache_revision != memory.revision:
+            self._plan_cache.clear()
+            self._cache_revision = memory.revision
+        key = self._cache_key(pantry, constraints, profile)
+        cached = self._plan_cache.get(key) if key is not None else None
+        if cached is not None:
+            self._plan_cache.move_to_end(key)
+            plan, summary, shopping = cached
+        else:
+            # Planner Agent
+            plan, estimated_total = self.planner.generate_weekly_plan(profile, pantry, constraints)
+            summary = {"plan": list(map(_summarize, plan)), "estimated_total": estimated_total}
+            # Shopping List Agent
+            shopping = self.shopper.build_shopping_list(plan, pantry)
+            if key is not None and self.plan_cache_size > 0:
+                self._plan_cache[key] = (plan, summary, shopping)
+                if len(self._plan_cache) > self.plan_cache_size:
+                    self._plan_cache.popitem(last=False)
         # Scheduler optionally
         schedule = []
-        if request.get("auto_schedule", False):
+        if auto_schedule:
             today = datetime.date.today()
             schedule = self.scheduler.schedule_meals(user_id, plan, today + datetime.timedelta(days=1))
-        # Save session & memory updates
-        self.memory.update_user(user_id, {"last_plan": summary, "last_shopping": shopping})
-        logger.info(f"[Master] Completed plan for user {user_id}. Estimated total: {summary['estimated_total']:.2f}")
-        return {"summary": summary, "shopping": shopping, "schedule": schedule}
+        # Save session & memory updates (buffered; written on flush). Memory and the
+        # caller each get their own copy so neither can corrupt the cached entry.
+        memory.update_user(user_id, {"last_plan": _copy_summary(summary), "last_shopping": _copy_shopping(shopping)})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Master] Completed plan for user %s. Estimated total: %.2f", user_id, summary["estimated_total"])
+        return {"summary": _copy_summary(summary), "shopping": _copy_shopping(shopping), "schedule": schedule}
+
+    @staticmethod
+    def _cache_key(pantry: frozenset, constraints: Dict[str, Any], profile: Dict[str, Any]):
+        # None when some input is unhashable (e.g. a list-valued constraint): such requests aren't cached
+        key = (pantry, tuple(sorted(constraints.items())), profile.get("diet"))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+# -------- micro-benchmark --------
+def _benchmark(chef: ConciergeChef, user_id: str, request: Dict[str, Any], n: int = 1000):
+    """Time n back-to-back handle_request calls (run under pypy3 to compare JIT speedup)."""
+    logging.disable(logging.INFO)
+    try:
+        start = time.perf_counter()
+        for _ in range(n):
+            # time the full pipeline, not plan-cache hits
+            chef._plan_cache.clear()
+            chef.handle_request(user_id, request)
+        elapsed = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+    print(f"{n} requests in {elapsed:.3f}s ({elapsed / n * 1e6:.1f} us/request)")
 
 # -------- simple demo run --------
 if __name__ == "__main__":
@@ -224,5 +566,12 @@ if __name__ == "__main__":
         "constraints": {"budget": 40, "max_time": 45},
         "auto_schedule": True
     }
+    if "--bench" in sys.argv:
+        # usage: python agent.py --bench [N]
+        args = sys.argv[sys.argv.index("--bench") + 1:]
+        _benchmark(chef, user_id, request, int(args[0]) if args else 1000)
+        mem.close()
+        sys.exit(0)
     out = chef.handle_request(user_id, request)
+    mem.close()
     print(json.dumps(out, indent=2))
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import agent
+
+logging.disable(logging.INFO)
+
+
+def _recipe(rid, ingredients, diet="vegetarian", time=20):
+    return {"id": rid, "title": f"Recipe {rid}", "ingredients": ingredients, "diet": diet, "time": time}
+
+
+class _TmpDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+
+    def make_planner(self, recipes):
+        path = os.path.join(self.tmp, "recipes.json")
+        with open(path, "w") as f:
+            json.dump(recipes, f)
+        return agent.PlannerAgent(agent.RecipeTool(path), agent.PriceTool())
+
+
+class MemoryBankTest(_TmpDirTestCase):
+    def open_bank(self, name="memory.json", **kwargs):
+        bank = agent.MemoryBank(os.path.join(self.tmp, name), **kwargs)
+        self.addCleanup(bank.close)
+        return bank
+
+    def test_legacy_json_store_is_imported_next_to_it(self):
+        with open(os.path.join(self.tmp, "memory.json"), "w") as f:
+            json.dump({"users": {"bob": {"pantry": ["rice"]}}}, f)
+        bank = self.open_bank()
+        self.assertEqual(bank.db_path, os.path.join(self.tmp, "memory.db"))
+        self.assertEqual(bank.get_user("bob"), {"pantry": ["rice"]})
+
+    def test_legacy_import_skips_a_populated_database(self):
+        bank = self.open_bank()
+        bank.update_users_batch([("carol", {"pantry": []})])
+        bank.close()
+        with open(os.path.join(self.tmp, "memory.json"), "w") as f:
+            json.dump({"users": {"bob": {"pantry": ["rice"]}}}, f)
+        reopened = self.open_bank()
+        self.assertEqual(reopened.get_user("bob")["pantry"], [])
+        self.assertEqual(reopened.get_user("carol"), {"pantry": []})
+
+    def test_missing_directory_is_created(self):
+        bank = self.open_bank(os.path.join("nested", "dir", "memory.json"))
+        bank.update_user("u", {"pantry": ["rice"]})
+        bank.close()
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "nested", "dir", "memory.db")))
+
+    def test_updates_are_buffered_until_flush(self):
+        bank = self.open_bank()
+        bank.update_user("u", {"pantry": ["rice"]})
+        self.assertEqual(self.open_bank().get_user("u")["pantry"], [])
+        bank.flush()
+        self.assertEqual(self.open_bank().get_user("u")["pantry"], ["rice"])
+
+    def test_batch_is_written_all_or_nothing(self):
+        bank = self.open_bank()
+        with self.assertRaises(TypeError):
+            bank.update_users_batch([("a", {"pantry": ["rice"]}), ("b", {"pantry": {"not", "json"}})])
+        self.assertEqual(self.open_bank().get_user("a")["pantry"], [])
+        bank.update_user("b", {"pantry": []})
+        bank.flush()
+        reopened = self.open_bank()
+        self.assertEqual(reopened.get_user("a"), {"pantry": ["rice"]})
+        self.assertEqual(reopened.get_user("b"), {"pantry": []})
+
+    def test_non_str_keys_are_stringified(self):
+        bank = self.open_bank()
+        bank.update_user("u", {"history": {1: "x"}})
+        bank.flush()
+        self.assertEqual(self.open_bank().get_user("u"), {"history": {"1": "x"}})
+
+    def test_revision_bumps_only_on_pantry_or_preferences(self):
+        bank = self.open_bank()
+        bank.update_user("u", {"last_plan": {}})
+        self.assertEqual(bank.revision, 0)
+        bank.update_user("u", {"pantry": ["rice"]})
+        bank.update_users_batch([("u", {"preferences": {"diet": "vegan"}}), ("v", {"history": []})])
+        self.assertEqual(bank.revision, 2)
+
+    def test_close_flushes_and_is_idempotent(self):
+        bank = self.open_bank()
+        bank.update_user("u", {"pantry": ["rice"]})
+        bank.close()
+        bank.close()
+        self.assertEqual(self.open_bank().get_user("u")["pantry"], ["rice"])
+
+
+class SolvePlanTest(_TmpDirTestCase):
+    def test_feasible_solve_maximizes_overlap_within_budget(self):
+        recipes = [_recipe(f"r{i}", ["rice", "tomato", f"x{i}"]) for i in range(5)]
+        recipes += [_recipe(f"s{i}", [f"y{i}", f"z{i}", "tomato"]) for i in range(5)]
+        planner = self.make_planner(recipes)
+        candidates = planner.recipe_tool.search({"diet": "vegetarian", "pantry": {"rice", "tomato"}})
+        plan = planner._solve_plan(candidates, budget=60)
+        self.assertEqual(len(plan), agent.WEEK_LEN)
+        self.assertEqual(len({p.rid for p in plan}), agent.WEEK_LEN)
+        # all five two-overlap recipes are used before the one-overlap ones
+        self.assertEqual(sum(p.pantry_overlap for p in plan), 5 * 2 + 2 * 1)
+        self.assertLessEqual(sum(p.estimated_cost for p in plan), 60)
+
+    def test_reuse_constraint_is_relaxed_when_unattainable(self):
+        recipes = [_recipe(f"r{i}", [f"a{i}", f"b{i}"]) for i in range(7)]
+        planner = self.make_planner(recipes)
+        candidates = planner.recipe_tool.search({"diet": "vegetarian", "pantry": set()})
+        plan = planner._solve_plan(candidates, budget=60)
+        self.assertEqual(len(plan), agent.WEEK_LEN)
+        self.assertEqual(sum(p.pantry_overlap for p in plan), 0)
+
+    def test_falls_back_to_heuristic_when_nothing_fits_budget(self):
+        recipes = [_recipe(f"r{i}", ["rice", "olive oil"]) for i in range(7)]
+        planner = self.make_planner(recipes)
+        candidates = planner.recipe_tool.search({"diet": "vegetarian", "pantry": {"rice"}})
+        self.assertIsNone(planner._solve_plan(candidates, budget=5))
+        plan, total = planner.generate_weekly_plan({"diet": "vegetarian"}, frozenset({"rice"}), {"budget": 5})
+        self.assertEqual(len(plan), agent.WEEK_LEN)
+        self.assertGreater(total, 5)
+
+    def test_recipes_repeat_only_to_fill_the_week(self):
+        planner = self.make_planner([_recipe(f"r{i}", ["rice"]) for i in range(3)])
+        candidates = planner.recipe_tool.search({"diet": "vegetarian", "pantry": {"rice"}})
+        plan = planner._solve_plan(candidates, budget=60)
+        self.assertEqual(len(plan), agent.WEEK_LEN)
+        counts = [sum(p.rid == rid for p in plan) for rid in ("r0", "r1", "r2")]
+        # spread as evenly as possible: ceil(7 / 3) == 3
+        self.assertLessEqual(max(counts), 3)
+
+    def test_fallback_picks_are_scored_against_the_pantry(self):
+        planner = self.make_planner([_recipe("a", ["rice", "tomato"]), _recipe("b", ["pasta"], diet="vegan")])
+        plan, _ = planner.generate_weekly_plan({"diet": "vegetarian"}, frozenset({"rice", "tomato", "pasta"}), {"budget": 1})
+        self.assertEqual(len(plan), agent.WEEK_LEN)
+        for p in plan:
+            self.assertEqual(p.pantry_overlap, {"a": 2, "b": 1}[p.rid])
+
+    def test_single_recipe_fills_the_week_rather_than_breaking_diet(self):
+        planner = self.make_planner([_recipe("only", ["rice"]), _recipe("beef", ["beef"], diet="omnivore")])
+        plan, _ = planner.generate_weekly_plan({"diet": "vegetarian"}, frozenset({"rice"}), {"budget": 60})
+        self.assertEqual([p.rid for p in plan], ["only"] * agent.WEEK_LEN)
+
+    def test_few_matches_never_pull_in_other_diets(self):
+        recipes = [_recipe("v1", ["tofu", "rice"], diet="vegan"), _recipe("v2", ["lentils"], diet="vegan")]
+        recipes += [_recipe(f"m{i}", ["beef", f"x{i}"], diet="omnivore") for i in range(5)]
+        planner = self.make_planner(recipes)
+        for budget in (60, 1):  # solver path, then heuristic fallback
+            plan, _ = planner.generate_weekly_plan({"diet": "vegan"}, frozenset({"rice"}), {"budget": budget})
+            self.assertEqual(len(plan), agent.WEEK_LEN)
+            self.assertLessEqual({p.rid for p in plan}, {"v1", "v2"})
+
+class PlanCacheTest(_TmpDirTestCase):
+    request = {"profile": {"diet": "vegetarian"}, "constraints": {"budget": 40, "max_time": 45}}
+
+    def make_chef(self, **kwargs):
+        memory = agent.MemoryBank(os.path.join(self.tmp, "memory.db"))
+        self.addCleanup(memory.close)
+        return agent.ConciergeChef(memory, **kwargs)
+
+    def test_cache_hit_returns_independent_copies(self):
+        chef = self.make_chef()
+        first = chef.handle_request("u", self.request)
+        expected_plan = [dict(m) for m in first["summary"]["plan"]]
+        first["summary"]["plan"].clear()
+        first["shopping"]["items"]["injected"] = 1
+        second = chef.handle_request("u", self.request)
+        self.assertEqual(second["summary"]["plan"], expected_plan)
+        self.assertNotIn("injected", second["shopping"]["items"])
+        second["summary"]["plan"][0]["ingredients"].append("injected")
+        stored = chef.memory.get_user("u")
+        self.assertNotIn("injected", stored["last_plan"]["plan"][0]["ingredients"])
+        self.assertNotIn("injected", chef.recipe_tool.recipes[0]["ingredients"])
+
+    def test_pantry_or_preferences_writes_invalidate_the_cache(self):
+        chef = self.make_chef()
+        calls = []
+        plan_week = chef.planner.generate_weekly_plan
+        chef.planner.generate_weekly_plan = lambda *args: calls.append(args) or plan_week(*args)
+        chef.handle_request("u", self.request)
+        chef.handle_request("u", self.request)
+        self.assertEqual(len(calls), 1)
+        chef.memory.update_user("u", {"history": ["unrelated"]})
+        chef.handle_request("u", self.request)
+        self.assertEqual(len(calls), 1)
+        chef.memory.update_user("u", {"preferences": {"diet": "vegetarian", "spice": "mild"}})
+        chef.handle_request("u", self.request)
+        self.assertEqual(len(calls), 2)
+        chef.memory.update_user("u", {"pantry": ["rice"]})
+        out = chef.handle_request("u", self.request)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(chef._plan_cache), 1)
+        self.assertNotIn("rice", out["shopping"]["items"])
+
+    def test_unhashable_constraints_skip_the_cache(self):
+        chef = self.make_chef()
+        request = {"constraints": {"budget": 40, "exclude": ["x"]}}
+        out = chef.handle_request("u", request)
+        self.assertEqual(len(out["summary"]["plan"]), agent.WEEK_LEN)
+        self.assertEqual(len(chef._plan_cache), 0)
+
+    def test_cache_is_bounded(self):
+        chef = self.make_chef(plan_cache_size=2)
+        for budget in (40, 41, 42):
+            chef.handle_request("u", {"constraints": {"budget": budget}})
+        self.assertEqual(len(chef._plan_cache), 2)
+        self.assertEqual([key[1] for key in chef._plan_cache], [(("budget", 41),), (("budget", 42),)])
+
+
+class RecipeSearchTest(_TmpDirTestCase):
+    def make_tool(self):
+        recipes = [_recipe(rid, ["rice", rid], time=t) for rid, t in (("c", 20), ("a", 20), ("b", 10), ("d", 30))]
+        recipes.append(_recipe("e", ["rice", "tomato"], time=30))
+        return self.make_planner(recipes).recipe_tool
+
+    def test_ties_break_on_time_then_id(self):
+        tool = self.make_tool()
+        query = {"diet": "vegetarian", "pantry": {"rice", "tomato"}}
+        orders = [[c.rid for c in tool.search(query)] for _ in range(3)]
+        self.assertEqual(orders[0], ["e", "b", "a", "c", "d"])
+        self.assertEqual(orders[1:], [orders[0]] * 2)
+
+    def test_seed_reproduces_jittered_order(self):
+        tool = self.make_tool()
+        query = {"diet": "vegetarian", "pantry": {"rice"}}
+        order = lambda seed: [c.rid for c in tool.search({**query, "seed": seed})]
+        self.assertEqual(order(7), order(7))
+        self.assertTrue(any(order(seed) != order(7) for seed in range(20)))
+
+
+class ShoppingListTest(unittest.TestCase):
+    def test_prices_come_from_the_price_tool(self):
+        class FlatPriceTool(agent.PriceTool):
+            def price(self, ing):
+                return 2.0
+
+        tool = agent.RecipeTool("missing.json")
+        plan = tool.search({"diet": "vegetarian", "pantry": {"rice"}})
+        shopping = agent.ShoppingListAgent(FlatPriceTool()).build_shopping_list(plan, {"rice"})
+        self.assertNotIn("rice", shopping["items"])
+        self.assertEqual(set(shopping["prices"].values()), {2.0})
+        self.assertEqual(shopping["estimated_total"], 2.0 * len(shopping["items"]))
+        self.assertEqual(FlatPriceTool().total_for(("rice", "tomato")), 4.0)
+        self.assertEqual(FlatPriceTool().estimate(["rice", "saffron"]), {"rice": 2.0, "saffron": 2.0})
+
+
+if __name__ == "__main__":
+    unittest.main()